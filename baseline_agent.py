@@ -37,10 +37,10 @@ class Agent(our_agent.Agent):
     def build_upsilon(self):
         return None
 
-    def get_dg(self, can_open_gate, ones, z):
+    def get_dg(self, can_open_gate, ones, z, sample=True):
         return torch.ones_like(ones), None
 
-    def get_delta(self, P, dg, line_mask, ones, z):
+    def get_delta(self, P, dg, line_mask, ones, z, sample=True):
         return torch.ones_like(ones) * self.nl, None
 
     def get_gru_in_size(self):
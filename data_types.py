@@ -1,10 +1,9 @@
 import itertools
 import typing
-from abc import abstractmethod, ABC, ABCMeta
-from collections import Counter
+from abc import abstractmethod
 from dataclasses import dataclass, astuple, replace, field
 from enum import unique, Enum, auto, EnumMeta
-from functools import lru_cache
+from functools import lru_cache, cached_property
 from typing import Tuple, Union, List, Generator, Dict, Generic, Optional
 
 import gym
@@ -24,13 +23,9 @@ WORLD_SIZE = None
 
 
 def move_from(origin: CoordType, toward: CoordType) -> CoordType:
-    origin = np.array(origin)
-    i, j = np.array(origin) + np.clip(
-        np.array(toward) - origin,
-        -1,
-        1,
-    )
-    return i, j
+    (i, j), (ti, tj) = origin, toward
+    # step at most one cell along each axis
+    return i + (ti > i) - (ti < i), j + (tj > j) - (tj < j)
 
 
 class InvalidInput(Exception):
@@ -59,10 +54,6 @@ class ActionComponentEnumMeta(ActionComponentMeta, EnumMeta):
     pass
 
 
-class ActionComponentABCMeta(ActionComponentMeta, ABCMeta):
-    pass
-
-
 class ActionComponent(metaclass=ActionComponentMeta):
     @staticmethod
     @abstractmethod
@@ -82,7 +73,7 @@ class ActionComponent(metaclass=ActionComponentMeta):
 ActionComponentGenerator = Generator[ActionComponent, None, None]
 
 
-class Building(WorldObject, ActionComponent, ABC, metaclass=ActionComponentABCMeta):
+class Building(WorldObject, ActionComponent):
     def __eq__(self, other):
         return type(self) == type(other)
 
@@ -91,13 +82,13 @@ class Building(WorldObject, ActionComponent, ABC, metaclass=ActionComponentABCMe
         return self.value < other.value
 
     def __hash__(self):
-        return hash(type)
+        return hash(type(self))
 
     def __str__(self):
         return self.__class__.__name__
 
     def __repr__(self):
-        return f"({Buildings.index(self)}) {str(self)}: {self.cost}"
+        return f"({BuildingIndex[self]}) {str(self)}: {self.cost}"
 
     @property
     @abstractmethod
@@ -121,7 +112,7 @@ class Building(WorldObject, ActionComponent, ABC, metaclass=ActionComponentABCMe
         pass
 
     def to_int(self) -> int:
-        return Buildings.index(self)
+        return BuildingIndex[self]
 
 
 class Assignment:
@@ -159,19 +150,15 @@ class Worker(WorldObject, ActionComponent, Enum, metaclass=ActionComponentEnumMe
     # W11 = auto()
     # W12 = auto()
 
-    def __eq__(self, other):
-        # noinspection PyArgumentList
-        return Enum.__eq__(self, other)
+    # alias Enum's slots directly rather than wrapping them in another call
+    __eq__ = Enum.__eq__
+    __hash__ = Enum.__hash__
 
     def __lt__(self, other):
         assert isinstance(other, Worker)
         # noinspection PyArgumentList
         return self.value < other.value
 
-    def __hash__(self):
-        # noinspection PyArgumentList
-        return Enum.__hash__(self)
-
     def on(
         self,
         coord: "CoordType",
@@ -203,11 +190,8 @@ class Resource(WorldObject, Assignment, Enum):
     MINERALS = auto()
     GAS = auto()
 
-    def __hash__(self):
-        return Enum.__hash__(self)
-
-    def __eq__(self, other):
-        return Enum.__eq__(self, other)
+    __hash__ = Enum.__hash__
+    __eq__ = Enum.__eq__
 
     def execute(
         self,
@@ -273,6 +257,10 @@ class Resources:
         yield from [Resource.MINERALS] * self.minerals
         yield from [Resource.GAS] * self.gas
 
+    def counts(self) -> Dict[Resource, int]:
+        # a mapping lets Counter.subtract skip iterating one token per unit
+        return {Resource.MINERALS: self.minerals, Resource.GAS: self.gas}
+
 
 assert set(Resources(0, 0).__annotations__.keys()) == {
     r.lower() for r in Resource.__members__
@@ -289,8 +277,7 @@ class Coord(ActionComponent):
     @staticmethod
     def parse(n: int) -> "Coord":
         assert isinstance(WORLD_SIZE, int)
-        ij = np.unravel_index(n, (WORLD_SIZE, WORLD_SIZE))
-        return Coord(*ij)
+        return Coord(*divmod(n, WORLD_SIZE))
 
     @staticmethod
     def possible_values():
@@ -342,7 +329,7 @@ class BuildOrder(Assignment):
         else:
             if self.coord not in pending_positions:
                 pending_positions[self.coord] = self.building
-                resources.subtract(self.building.cost)
+                resources.subtract(self.building.cost.counts())
             return GoTo(self.coord).execute(
                 positions=positions,
                 worker=worker,
@@ -411,6 +398,7 @@ class RawAction:
 Ob = Optional[bool]
 OB = Optional[Building]
 OC = Optional[Coord]
+WORKER_VALUES: Tuple[Ob, ...] = (False, True)
 
 
 @dataclass(frozen=True)
@@ -420,8 +408,8 @@ class CompoundAction:
     coord: OC = None
 
     @staticmethod
-    def _worker_values() -> List[Ob]:
-        return [False, True]
+    def _worker_values() -> Tuple[Ob, ...]:
+        return WORKER_VALUES
 
     @classmethod
     def input_space(cls):
@@ -435,7 +423,14 @@ class CompoundAction:
 
     @classmethod
     def parse(cls, *values: int) -> "CompoundAction":
-        *ws, b, c = map(int, values)
+        return cls._parse(*map(int, values), world_size=WORLD_SIZE)
+
+    @classmethod
+    @lru_cache
+    def _parse(cls, *values: int, world_size: int) -> "CompoundAction":
+        # parsed actions are immutable, so identical inputs share one instance.
+        # world_size is only part of the cache key, since Coord.parse depends on it.
+        *ws, b, c = values
         return CompoundAction(
             worker_values=[cls._worker_values()[w] for w in ws],
             building=None if b == 0 else Building.parse(b - 1),
@@ -565,6 +560,11 @@ class ActionStage:
             mask[R, unmask] = 0
         return mask
 
+    @cached_property
+    def partial_action(self) -> np.ndarray:
+        # stages are frozen, so an unchanged stage reuses its encoding across steps
+        return np.array([*self.to_ints()])
+
     def to_ints(self):
         return self.action_components().to_representation_ints()
 
@@ -572,7 +572,7 @@ class ActionStage:
         return self._update(CompoundAction.parse(*components))
 
 
-class CoordCanOpenGate(ActionStage, ABC):
+class CoordCanOpenGate(ActionStage):
     @staticmethod
     def _gate_openers() -> CompoundActionGenerator:
         for i, j in Coord.possible_values():
@@ -645,7 +645,7 @@ class NoWorkersAction(ActionStage):
 
 
 @dataclass(frozen=True)
-class HasWorkers(ActionStage, ABC):
+class HasWorkers(ActionStage):
     workers: List[Worker]
 
     def action_components(self) -> CompoundAction:
@@ -717,6 +717,27 @@ class CoordAction(HasWorkers, NoWorkersAction):
         return GoTo((i, j))
 
 
+def unmet_dependency(
+    building: Building,
+    dependencies: Dict[Building, Building],
+    building_positions: BuildingPositions,
+) -> Optional[Building]:
+    dependency = dependencies[building]
+    if dependency is None or dependency in building_positions.values():
+        return None
+    return dependency
+
+
+def insufficient_resources(
+    building: Building, resources: typing.Counter[Resource]
+) -> bool:
+    cost = building.cost  # compare counts instead of expanding cost into tokens
+    return (
+        cost.minerals > resources[Resource.MINERALS]
+        or cost.gas > resources[Resource.GAS]
+    )
+
+
 @dataclass(frozen=True)
 class BuildingAction(HasWorkers, CoordCanOpenGate):
     building: Building
@@ -760,12 +781,10 @@ class BuildingAction(HasWorkers, CoordCanOpenGate):
         *args,
         **kwargs,
     ) -> Optional[str]:
-        dependency = dependencies[self.building]
-        dependency_met = dependency in [*building_positions.values(), None]
-        if not dependency_met:
+        dependency = unmet_dependency(self.building, dependencies, building_positions)
+        if dependency is not None:
             return f"Dependency ({dependency}) not met for {self}."
-        insufficient_resources = Counter(self.building.cost) - resources
-        if insufficient_resources:
+        if insufficient_resources(self.building, resources):
             return "Insufficient resources"
         return None
 
@@ -796,15 +815,14 @@ class BuildingCoordAction(HasWorkers, NoWorkersAction):
         pending_positions: BuildingPositions,
         positions: Positions,
     ) -> Optional[str]:
-        dependency = dependencies[self.building]
-        if not dependency in [*building_positions.values(), None]:
+        dependency = unmet_dependency(self.building, dependencies, building_positions)
+        if dependency is not None:
             return f"Dependency ({dependency}) not met for {self.building}."
         coord = astuple(self.coord)
-        all_positions = {**building_positions, **pending_positions}
-        if coord in all_positions:
-            return f"coord occupied by {all_positions[coord]}"
-        insufficient_resources = Counter(self.building.cost) - resources
-        if insufficient_resources:
+        occupant = pending_positions.get(coord, building_positions.get(coord))
+        if occupant is not None:
+            return f"coord occupied by {occupant}"
+        if insufficient_resources(self.building, resources):
             return "Insufficient resources"
         if isinstance(self.building, Assimilator):
             return (
@@ -838,6 +856,17 @@ class Line:
 
 @dataclass
 class State:
+    # one State is allocated per step; slots keep it small
+    __slots__ = (
+        "action",
+        "building_positions",
+        "pointer",
+        "positions",
+        "resources",
+        "success",
+        "time_remaining",
+        "valid",
+    )
     action: ActionStage
     building_positions: Dict[CoordType, Building]
     pointer: int
@@ -871,15 +900,9 @@ def get_nearest(
     candidate_positions: List[CoordType],
     to: CoordType,
 ) -> CoordType:
-    nearest = np.argmin(
-        np.max(
-            np.abs(
-                np.expand_dims(np.array(to), 0) - np.stack(candidate_positions),
-            ),
-            axis=-1,
-        )
-    )
-    return candidate_positions[int(nearest)]
+    i, j = to
+    # Chebyshev distance; min keeps the first of equally near candidates, like argmin
+    return min(candidate_positions, key=lambda p: max(abs(p[0] - i), abs(p[1] - j)))
 
 
 class Assimilator(Building):
@@ -1039,3 +1062,5 @@ Buildings: List[Building] = [
     TwilightCouncil(),
 ]
 WorldObjects = list(Buildings) + list(Resource) + list(Worker)
+BuildingIndex: Dict[Building, int] = {b: i for i, b in enumerate(Buildings)}
+WorldObjectIndex: Dict[WorldObject, int] = {o: i for i, o in enumerate(WorldObjects)}
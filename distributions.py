@@ -87,7 +87,8 @@ class DiagGaussian(nn.Module):
         action_mean = self.fc_mean(x)
 
         #  An ugly hack for my KFAC implementation.
-        zeros = torch.zeros_like(action_mean)
+        # a single row suffices: Normal broadcasts the std across the batch
+        zeros = action_mean.new_zeros(1, action_mean.size(-1))
         action_logstd = self.logstd(zeros)
         return FixedNormal(action_mean, action_logstd.exp())
 
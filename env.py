@@ -3,8 +3,8 @@ import pickle
 import re
 import sys
 import typing
-from collections import Counter, OrderedDict
-from dataclasses import astuple, asdict, dataclass, replace
+from collections import Counter
+from dataclasses import astuple, asdict, dataclass
 from itertools import zip_longest
 from multiprocessing import Queue
 from pathlib import Path
@@ -37,18 +37,33 @@ from data_types import (
     Building,
     WorldObject,
     WorldObjects,
+    WorldObjectIndex,
     Worker,
     State,
     Line,
     ActionStage,
     RawAction,
     Buildings,
+    BuildingIndex,
     Assimilator,
     Nexus,
 )
 from utils import RESET, Discrete
 
 Dependencies = Dict[Building, Building]
+RESOURCE_CAP = 500
+# keyed by (still required, line.required)
+LINE_SYMBOLS = {
+    (True, True): "*",
+    (True, False): "↘",
+    (False, True): "✓",
+    (False, False): " ",
+}
+
+
+def building_counts(buildings: typing.Iterable[Building]) -> np.ndarray:
+    indices = np.array([BuildingIndex[b] for b in buildings], dtype=int)
+    return np.bincount(indices, minlength=len(Buildings))
 
 
 def multi_worker_symbol(num_workers: int):
@@ -150,6 +165,20 @@ class Env(gym.Env):
             ptr=pointer_space,
         )
         self.observation_space = spaces.Dict(asdict(self.obs_spaces))
+        possible_lines = [Line(r, b) for r in (False, True) for b in Buildings]
+        self.preprocessed_lines: Dict[Optional[Line], List[int]] = {
+            line: self.preprocess_line(line) for line in [None, *possible_lines]
+        }
+        self.max_symbol_size = max(
+            [
+                len(multi_worker_symbol(len(Worker))),
+                *[len(strip_color(str(x.symbol))) for x in WorldObjects],
+            ]
+        )
+        self.padded_symbols: Dict[WorldObject, str] = {
+            o: o.symbol + " " * (self.max_symbol_size - len(strip_color(o.symbol)))
+            for o in WorldObjects
+        }
 
     def build_dependencies(
         self, max_depth: int = None
@@ -166,44 +195,36 @@ class Env(gym.Env):
         yield from itertools.zip_longest(buildings, dependencies)
 
     def build_lines(self, dependencies: Dependencies) -> List[Line]:
-        def instructions_for(building: Building):
-            if building is None:
-                return
-            yield from instructions_for(dependencies[building])
-            yield building
+        chains: Dict[Building, List[Building]] = {}
 
-        def random_instructions_under(
-            n: int, include_assimilator: bool = True
-        ) -> Generator[List[Line], None, None]:
-            if n < 0:
-                raise RuntimeError
-            if n == 0:
-                return
-            building, first, last, inst = None, None, None, None
-            while None in (building, first, last, inst) or len(inst) > n:
-                building = self.random.choice(
-                    [
-                        *filter(
-                            lambda b: (
-                                include_assimilator or not isinstance(b, Assimilator)
-                            ),
-                            Buildings,
-                        )
-                    ]
-                )
-
-                inst = *first, last = [*instructions_for(building)]
-            for i in first:
-                yield Line(False, i)
-            yield Line(True, last)
-            yield from random_instructions_under(
-                n=n - len(inst),
-                include_assimilator=include_assimilator
-                and not isinstance(building, Assimilator),
-            )
-
-        n_lines = self.n_lines_space.sample()
-        instructions = [*random_instructions_under(n_lines)]
+        def instructions_for(building: Building) -> List[Building]:
+            if building is None:
+                return []
+            if building not in chains:  # dependencies are fixed for the episode
+                chains[building] = [*instructions_for(dependencies[building]), building]
+            return chains[building]
+
+        chain_lengths = [(b, len(instructions_for(b))) for b in Buildings]
+        n = self.n_lines_space.sample()
+        include_assimilator = True
+        instructions = []
+        while n > 0:
+            # sample only among buildings whose chain fits instead of retrying;
+            # same distribution, but fewer draws, so seeded episodes differ
+            # from those generated by the retry loop
+            candidates = [
+                b
+                for b, length in chain_lengths
+                if length <= n
+                and (include_assimilator or not isinstance(b, Assimilator))
+            ]
+            # same draw as random.choice, without boxing the list into an array
+            building = candidates[self.random.randint(len(candidates))]
+            inst = *first, last = instructions_for(building)
+            instructions.extend(Line(False, i) for i in first)
+            instructions.append(Line(True, last))
+            n -= len(inst)
+            include_assimilator &= not isinstance(building, Assimilator)
         return instructions
 
     @staticmethod
@@ -296,6 +317,7 @@ class Env(gym.Env):
             else:
                 print(fg("blue"), "Did not use failure buffer", RESET)
 
+        suffix = f" ({'with' if use_failure_buf else 'without'} failure buffer)"
         while True:
             s, r, t, i = iterator.send(action)
             render_thunk = self.render_thunk
@@ -304,12 +326,7 @@ class Env(gym.Env):
                 success = i["success"]
 
                 if not self.evaluating:
-                    i.update(
-                        {
-                            f"{k} ({'with' if use_failure_buf else 'without'} failure buffer)": v
-                            for k, v in i.items()
-                        }
-                    )
+                    i.update({k + suffix: v for k, v in i.items()})
 
                 def interpolate(old, new):
                     return old + self.alpha * (new - old)
@@ -342,18 +359,17 @@ class Env(gym.Env):
         info = {}
         elapsed_time = -1
 
+        # lines are fixed for the episode, so everything reported about them is too
+        if self.evaluating:
+            lower = (len(lines) - 1) // self.bucket_size * self.bucket_size + 1
+            upper = (1 + (len(lines) - 1) // self.bucket_size) * self.bucket_size
+            key = f"success on instructions length-{lower} through length-{upper}"
+        else:
+            key = f"success on length-{len(lines)} instructions"
+        single_gas_line = len(lines) == 1 and lines[0].building.cost.gas > 0
+
         while True:
             if done:
-                if self.evaluating:
-                    lower = (len(lines) - 1) // self.bucket_size * self.bucket_size + 1
-                    upper = (
-                        1 + (len(lines) - 1) // self.bucket_size
-                    ) * self.bucket_size
-                    key = (
-                        f"success on instructions length-{lower} through length-{upper}"
-                    )
-                else:
-                    key = f"success on length-{len(lines)} instructions"
                 info.update(
                     {
                         f"success": float(state.success),
@@ -362,10 +378,8 @@ class Env(gym.Env):
                         "time per line": elapsed_time / len(lines),
                     },
                 )
-                if len(lines) == 1 and elapsed_time > 0:
-                    (line,) = lines
-                    if line.building.cost.gas > 0:
-                        info.update({"success on gas buildings": state.success})
+                if single_gas_line and elapsed_time > 0:
+                    info.update({"success on gas buildings": state.success})
 
             # noinspection PyTupleAssignmentBalance
             state, done = yield info, lambda: None
@@ -384,11 +398,7 @@ class Env(gym.Env):
         state: State
         state = yield
 
-        padded: List[Optional[Line]] = [
-            *lines,
-            *[None] * (self.max_lines - len(lines)),
-        ]
-        line_mask = np.array([p is None for p in padded])
+        line_mask = np.arange(self.max_lines) >= len(lines)
 
         def render():
             def requirement_for():
@@ -399,70 +409,73 @@ class Env(gym.Env):
                     yield depending
 
             def required_iterator():
-                buildings = [*state.building_positions.values()]
+                buildings = Counter(state.building_positions.values())
                 dependers = reversed([*requirement_for()])
                 for l, d in zip(lines, dependers):
-                    built = l.building in buildings
-                    yield l.building not in buildings and d not in buildings
+                    built = buildings[l.building] > 0
+                    yield not built and not buildings[d]
                     if built and l.required:
-                        buildings.remove(l.building)
+                        buildings[l.building] -= 1
 
             for i, (required, line) in enumerate(zip(required_iterator(), lines)):
-                symbol = (
-                    ("*" if line.required else "↘")
-                    if required
-                    else ("✓" if line.required else " ")
-                )
-
                 print(
                     "{:2}{}{} {}".format(
                         i,
                         "-" if i == state.pointer else " ",
-                        symbol,
+                        LINE_SYMBOLS[required, line.required],
                         repr(line.building),
                     )
                 )
             print("Obs:")
-            for string in self.room_strings(array):
-                print(string, end="")
+            print(*self.room_strings(array), sep="", end="")
 
-        preprocessed = np.array([*map(self.preprocess_line, padded)])
+        padding = self.preprocessed_lines[None]
+        preprocessed = np.tile(padding, (self.max_lines, 1))
+        for i, line in enumerate(lines):
+            preprocessed[i] = self.preprocessed_lines[line]
 
         def coords():
             yield from state.positions.items()
             for p, b in state.building_positions.items():
                 yield b, p
 
+        world = np.zeros((len(WorldObjects), *self.world_shape))
+        checked = False
+        n_resources = len(Resource)
+
         while True:
-            world = np.zeros((len(WorldObjects), *self.world_shape))
-            for o, p in coords():
-                world[(WorldObjects.index(o), *p)] = 1
+            # reuse one buffer per episode and write all occupied cells at once
+            world[:] = 0
+            objects, positions = zip(*coords())
+            world[([WorldObjectIndex[o] for o in objects], *zip(*positions))] = 1
             array = world
-            resources = np.array([state.resources[r] for r in Resource])
+            resources = np.fromiter(
+                map(state.resources.__getitem__, Resource), dtype=int, count=n_resources
+            )
             assert isinstance(state.action, ActionStage)
 
-            partial_action = np.array([*state.action.to_ints()])
-            obs = OrderedDict(
-                asdict(
-                    Obs(
-                        obs=array,
-                        resources=resources,
-                        line_mask=line_mask,
-                        lines=preprocessed,
-                        action_mask=state.action.mask().ravel(),
-                        partial_action=partial_action,
-                        ptr=state.pointer,
-                    )
+            # vars rather than asdict: fields stay in order without deep-copying arrays
+            obs = vars(
+                Obs(
+                    obs=array,
+                    resources=resources,
+                    line_mask=line_mask,
+                    lines=preprocessed,
+                    action_mask=state.action.mask().ravel(),
+                    partial_action=state.action.partial_action,
+                    ptr=state.pointer,
                 )
             )
-            for (k, space), (n, o) in zip(
-                self.observation_space.spaces.items(), obs.items()
-            ):
-                if not space.contains(o):
-                    import ipdb
-
-                    ipdb.set_trace()
-                    space.contains(o)
+            if not checked:  # shapes and dtypes are fixed for the episode
+                for (k, space), (n, o) in zip(
+                    self.observation_space.spaces.items(), obs.items()
+                ):
+                    if not space.contains(o):
+                        import ipdb
+
+                        ipdb.set_trace()
+                        space.contains(o)
+                checked = True
             # noinspection PyTypeChecker
             state = yield obs, lambda: render()  # perform time-step
 
@@ -474,12 +487,9 @@ class Env(gym.Env):
         for w in Worker:
             yield w, nexus
         resource_offsets = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
-        resource_locations = [
-            *filter(
-                self.world_space.contains,
-                nexus + resource_offsets,
-            )
-        ]
+        resource_locations = nexus + resource_offsets
+        in_bounds = (0 <= resource_locations) & (resource_locations < self.world_size)
+        resource_locations = resource_locations[in_bounds.all(axis=1)]
         minerals, gas = self.random.choice(
             len(resource_locations), size=2, replace=False
         )
@@ -489,20 +499,22 @@ class Env(gym.Env):
         yield Resource.GAS, gas
 
         occupied = [nexus, minerals, gas]
-        occupied_indices = np.sort(
+        free = np.ones(self.world_size ** 2, dtype=bool)
+        free[
             np.ravel_multi_index(np.stack(occupied, axis=-1), self.world_shape)
-        )
+        ] = False
+        (free_indices,) = free.nonzero()
 
-        max_initial_buildings = max(0, (self.world_size ** 2 - len(occupied) - n_lines))
+        max_initial_buildings = max(0, (len(free_indices) - n_lines))
         if max_initial_buildings > 0:
             num_initial_buildings = self.random.randint(max_initial_buildings + 1)
-            initial_index = self.random.choice(
-                self.world_size ** 2 - len(occupied),
-                size=num_initial_buildings,
-                replace=False,
-            )
-            for i in occupied_indices:
-                initial_index[initial_index >= i] += 1
+            initial_index = free_indices[
+                self.random.choice(
+                    len(free_indices),
+                    size=num_initial_buildings,
+                    replace=False,
+                )
+            ]
             initial_pos = np.stack(
                 np.unravel_index(initial_index, self.world_shape), axis=-1
             )
@@ -519,7 +531,7 @@ class Env(gym.Env):
     def preprocess_line(line: Optional[Line]):
         if line is None:
             return [0, 0]
-        return [int(line.required), Buildings.index(line.building)]
+        return [int(line.required), BuildingIndex[line.building]]
 
     def render(self, mode="human", pause=True):
         self.render_thunk()
@@ -533,35 +545,33 @@ class Env(gym.Env):
         return s
 
     def room_strings(self, room):
-        max_symbol_size = max(
-            [
-                len(multi_worker_symbol(len(Worker))),
-                *[len(strip_color(str(x.symbol))) for x in WorldObjects],
-            ]
-        )
+        max_symbol_size = self.max_symbol_size
+        blank = " " * max_symbol_size
         max_symbols_per_grid = 3
-        for i, row in enumerate(room.transpose((1, 2, 0)).astype(int)):
-            for j, channel in enumerate(row):
-                (nonzero,) = channel.nonzero()
-                objects = [WorldObjects[k] for k in nonzero]
+        grid_size = max_symbols_per_grid * max_symbol_size
+        separator = f"\n" + ("-" * (grid_size) + "+") * self.world_size + "\n"
+        grid = room.transpose((1, 2, 0))  # a view; nonzero needs no int copy
+        height, width, _ = grid.shape
+        occupants = [[[] for _ in range(width)] for _ in range(height)]
+        for i, j, k in zip(*grid.nonzero()):  # one pass over the whole grid
+            occupants[i][j].append(WorldObjects[k])
+        for row in occupants:
+            for objects in row:
                 worker_symbol = None
                 if len(objects) > max_symbols_per_grid:
                     worker_symbol = f"w{sum([isinstance(o, Worker) for o in objects])}"
                     objects = [o for o in objects if not isinstance(o, Worker)]
-                symbols = [o.symbol for o in objects]
+                symbols = [self.padded_symbols[o] for o in objects]
                 if worker_symbol is not None:
-                    symbols += [worker_symbol]
-
-                for _, symbol in zip_longest(range(max_symbols_per_grid), symbols):
-                    if symbol is None:
-                        symbol = " " * max_symbol_size
-                    else:
-                        symbol += " " * (max_symbol_size - len(strip_color(symbol)))
-                    yield from symbol
+                    symbols += [worker_symbol.ljust(max_symbol_size)]
+
+                for _, symbol in zip_longest(
+                    range(max_symbols_per_grid), symbols, fillvalue=blank
+                ):
+                    yield symbol
                 yield RESET
                 yield "|"
-            grid_size = max_symbols_per_grid * max_symbol_size
-            yield f"\n" + ("-" * (grid_size) + "+") * self.world_size + "\n"
+            yield separator
 
     @staticmethod
     def reward_generator():
@@ -628,7 +638,7 @@ class Env(gym.Env):
             state, render_state = state_iterator.send(a)
             if self.evaluating:
                 time_remaining -= 1
-                state = replace(state, time_remaining=time_remaining)
+                state.time_remaining = time_remaining  # state is fresh each step
 
     def state_generator(
         self, lines: List[Line], dependencies: Dict[Building, Building]
@@ -649,6 +659,7 @@ class Env(gym.Env):
         )
         assignments: Dict[Worker, Assignment] = {w: Resource.MINERALS for w in Worker}
         required = Counter(li.building for li in lines if li.required)
+        required_counts = building_counts(required.elements())
         resources: typing.Counter[Resource] = Counter()
         carrying: Carrying = {w: None for w in Worker}
         ptr: int = 0
@@ -672,12 +683,14 @@ class Env(gym.Env):
 
         self.render_thunk = render
 
+        built_counts = building_counts(building_positions.values())
         while True:
-            resources = resources & Counter(
-                {Resource.MINERALS: 500, Resource.GAS: 500}
-            )  # cap resources
-            remaining = required - Counter(building_positions.values())
-            success = not remaining
+            # cap resources; one fresh Counter per state, like the old
+            # `resources & Counter(...)` (non-positive counts are dropped)
+            resources = Counter(
+                {r: min(n, RESOURCE_CAP) for r, n in resources.items() if n > 0}
+            )
+            success = bool(np.all(built_counts >= required_counts))
 
             state = State(
                 building_positions=building_positions,
@@ -723,12 +736,15 @@ class Env(gym.Env):
             for worker in action.get_workers():
                 assignments[worker] = assignment
 
+            # collect resources first, otherwise keeping assignment order
+            gathering, other = [], []
+            for worker_id, assignment in assignments.items():
+                is_resource = type(assignment) is Resource
+                (gathering if is_resource else other).append((worker_id, assignment))
+
+            n_built = len(building_positions)  # builds only ever add buildings
             worker_id: Worker
-            for worker_id, assignment in sorted(
-                assignments.items(),
-                key=lambda w: isinstance(w[1], Resource),
-                reverse=True,
-            ):  # collect resources first.
+            for worker_id, assignment in gathering + other:
                 error_msg = assignment.execute(
                     positions=positions,
                     worker=worker_id,
@@ -741,7 +757,8 @@ class Env(gym.Env):
                 )
 
             destroy = []
-            if self.random.random() < self.attack_prob / len(lines):
+            attack_prob = self.attack_prob / len(lines)
+            if attack_prob and self.random.random() < attack_prob:
                 num_destroyed = self.random.randint(len(building_positions))
                 destroy = [
                     (c, b)
@@ -753,9 +770,12 @@ class Env(gym.Env):
                 for coord, _ in destroy:
                     del building_positions[coord]
 
+            if destroy or len(building_positions) != n_built:
+                built_counts = building_counts(building_positions.values())
+
     def step(self, action: Union[np.ndarray, ActionStage]):
         if isinstance(action, np.ndarray):
-            action = RawAction.parse(*action)
+            action = RawAction.parse(*action.tolist())  # plain ints, converted at once
         return self.iterator.send(action)
 
 
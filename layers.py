@@ -151,14 +151,19 @@ class Times(torch.jit.ScriptModule):
 class MultiEmbeddingBag(nn.Module):
     def __init__(self, nvec: Union[np.ndarray, torch.Tensor], **kwargs):
         super().__init__()
-        self.embedding = nn.Embedding(num_embeddings=nvec.sum(), **kwargs)
+        # each row of fields is one bag, so lookup and sum run as a single kernel
+        self.embedding = nn.EmbeddingBag(
+            num_embeddings=nvec.sum(), mode="sum", **kwargs
+        )
         self.register_buffer(
             "offset",
             F.pad(torch.tensor(nvec[:-1]).cumsum(0), [1, 0]),
         )
 
     def forward(self, inputs):
-        return self.embedding(self.offset + inputs).sum(-2)
+        indices = self.offset + inputs
+        *shape, fields = indices.shape
+        return self.embedding(indices.view(-1, fields)).view(*shape, -1)
 
 
 class IntEncoding(nn.Module):
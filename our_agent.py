@@ -1,6 +1,7 @@
 from collections import Hashable
 from contextlib import contextmanager
 from dataclasses import dataclass, replace
+from functools import lru_cache
 
 import numpy as np
 import torch
@@ -41,12 +42,24 @@ def conv_output_dimension(h, padding, kernel, stride, dilation=1):
 
 
 def get_obs_sections(obs_spaces):
-    return [int(np.prod(s.shape)) for s in astuple(obs_spaces)]
+    # slices into the flat obs vector, computed once rather than per torch.split
+    sizes = [int(np.prod(s.shape)) for s in astuple(obs_spaces)]
+    ends = np.cumsum(sizes).tolist()
+    return tuple(slice(end - size, end) for size, end in zip(sizes, ends))
+
+
+@lru_cache
+def last_indicator(n: int, device: torch.device) -> torch.Tensor:
+    # (1, n, 1) with a 1 in the last position; built once per size and device
+    last = torch.zeros(n, device=device)
+    last[-1] = 1
+    return last.view(1, -1, 1)
 
 
 def gate(g, new, old):
-    old = torch.zeros_like(new).scatter(1, old.unsqueeze(1), 1)
-    return Categorical(probs=g * new + (1 - g) * old)
+    old = F.one_hot(old, new.size(-1)).type_as(new)
+    # g * new + (1 - g) * old in one kernel; g may arrive as a long mask
+    return Categorical(probs=torch.lerp(old, new, g.type_as(new)))
 
 
 @dataclass
@@ -278,26 +291,28 @@ class Agent(NNBase):
         if action is None:
             action = RawAction.parse(None, None, None, None)
         else:
-            action = RawAction.parse(*action.unbind(-1))
-            action = replace(action, a=torch.stack(action.a, dim=-1))
+            # slice rather than unbinding every column and restacking a;
+            # a is made contiguous because Categorical.log_prob views it
+            delta, dg, ptr = action[..., :3].unbind(-1)
+            a = action[..., 3:].contiguous()
+            action = RawAction(delta=delta, dg=dg, ptr=ptr, a=a)
 
         # parse non-action inputs
-        state = Obs(*torch.split(inputs, self.obs_sections, dim=-1))
+        state = Obs(*(inputs[..., section] for section in self.obs_sections))
         state = replace(state, obs=state.obs.view(N, *self.obs_spaces.obs.shape))
         lines = state.lines.view(N, *self.obs_spaces.lines.shape).long()
+        p = state.ptr.long().flatten()
         line_mask = state.line_mask.view(N, self.nl)
         line_mask = F.pad(line_mask, [self.nl, 0], value=1)  # pad for backward mask
-        line_mask = torch.stack(
-            [torch.roll(line_mask, shifts=-i, dims=-1) for i in range(self.nl)], dim=0
-        )
+        # roll each row left by its pointer (only the roll that gets used)
+        width = 2 * self.nl
+        roll = (torch.arange(width, device=p.device) + p.unsqueeze(-1)) % width
+        line_mask = line_mask.gather(-1, roll)
         # mask[:, :, 0] = 0  # prevent self-loops
         # line_mask = line_mask.view(self.nl, N, 2, self.nl).transpose(2, 3).unsqueeze(-1)
 
         # build memory
-        M = self.embed_instruction(
-            lines.view(-1, self.obs_spaces.lines.nvec[0].size)
-        ).view(N, -1, self.instruction_embed_size)
-        p = state.ptr.long().flatten()
+        M = self.embed_instruction(lines)  # (N, nl, instruction_embed_size)
         R = torch.arange(N, device=p.device)
 
         x = self.conv(state.obs)
@@ -312,13 +327,14 @@ class Agent(NNBase):
             else embedded_action
         )
         h, rnn_hxs = self._forward_gru(gru_in, rnn_hxs, masks)
-        z1 = torch.cat([x, resources, embedded_action, h], dim=-1)
+        # concatenate once; z1 is a view of the leading features
+        z = torch.cat([x, resources, embedded_action, h, m], dim=-1)
+        z1 = z[..., : self.z1_size]
 
         G = self.get_G(M=M, R=R, p=p, z1=z1)
 
         ones = self.ones.expand_as(R)
         P = self.get_P(p, G, R)
-        z = torch.cat([z1, m], dim=-1)
         if self.add_layer:
             z = self.zeta(z)
         zc = z
@@ -350,11 +366,12 @@ class Agent(NNBase):
         #     except ValueError:
         #         pass
 
-        more_than_1_line = (1 - line_mask[p, R]).sum(-1) > 1
+        more_than_1_line = (1 - line_mask).sum(-1) > 1
         dg, dg_dist = self.get_dg(
             can_open_gate=more_than_1_line,
             ones=ones,
             z=z,
+            sample=action.dg is None,
         )
         dists = replace(dists, dg=dg_dist)
         if action.dg is None:
@@ -373,9 +390,10 @@ class Agent(NNBase):
         delta, delta_dist = self.get_delta(
             P=P,
             dg=action.dg,
-            line_mask=line_mask[p, R],
+            line_mask=line_mask,
             ones=ones,
             z=z,
+            sample=action.delta is None,
         )
         dists = replace(dists, delta=delta_dist)
 
@@ -438,15 +456,15 @@ class Agent(NNBase):
             log=dict(entropy=entropy),
         )
 
-    def get_delta(self, P, dg, line_mask, ones, z):
+    def get_delta(self, P, dg, line_mask, ones, z, sample=True):
         u = self.upsilon(z).softmax(dim=-1)
         self.print("u", u)
-        d_probs = (P @ u.unsqueeze(-1)).squeeze(-1)
+        d_probs = torch.einsum("nle,ne->nl", P, u)
         self.print("d_probs", d_probs.view(d_probs.size(0), 2, -1))
         unmask = 1 - line_mask
         masked = unmask * d_probs
         sum_zero = masked.sum(-1, keepdim=True) < 1 / self.inf
-        masked = ~sum_zero * masked + sum_zero * torch.ones_like(masked) / self.inf
+        masked = masked.masked_fill(sum_zero, 1 / self.inf)
         normalizer = (masked + 1 - dg.unsqueeze(-1)).sum(-1, keepdim=True)
         normalized = masked / normalizer
         self.print("normalized", normalized.view(normalized.size(0), 2, -1))
@@ -455,16 +473,16 @@ class Agent(NNBase):
         self.print(
             "dists.delta", delta_dist.probs.view(delta_dist.probs.size(0), 2, -1)
         )
-        delta = delta_dist.sample()
+        delta = delta_dist.sample() if sample else None  # skip when action is given
         return delta, delta_dist
 
-    def get_dg(self, can_open_gate, ones, z):
+    def get_dg(self, can_open_gate, ones, z, sample=True):
         d_logits = self.d_gate(z)
         dg_probs = F.softmax(d_logits, dim=-1)
         can_open_gate = can_open_gate.long().unsqueeze(-1)
         dg_dist = gate(can_open_gate, dg_probs, ones * 0)
         self.print("dg prob", dg_dist.probs[:, 1])
-        dg = dg_dist.sample()
+        dg = dg_dist.sample() if sample else None  # skip when action is given
         return dg, dg_dist
 
     def get_gru_in_size(self):
@@ -473,9 +491,9 @@ class Agent(NNBase):
         ) + self.action_embed_size
 
     def get_G(self, M, R, p, z1):
-        rolled = torch.stack(
-            [torch.roll(M, shifts=-i, dims=1) for i in range(self.nl)], dim=0
-        )[p, R]
+        # M rolled left by p for each batch element, without building every roll
+        roll = (torch.arange(self.nl, device=p.device) + p.unsqueeze(-1)) % self.nl
+        rolled = M[R.unsqueeze(-1), roll]
         _z = z1.unsqueeze(1).expand(-1, rolled.size(1), -1)
         rolled = torch.cat([rolled, _z], dim=-1)
         G, _ = self.encode_G(rolled)
@@ -490,9 +508,7 @@ class Agent(NNBase):
         B = torch.stack([f, b.flip(-2)], dim=-2)
         B = B.view(N, 2 * self.nl, self.num_edges)
 
-        last = torch.zeros(2 * self.nl, device=p.device)
-        last[-1] = 1
-        last = last.view(1, -1, 1)
+        last = last_indicator(2 * self.nl, p.device)
 
         B = (1 - last).flip(-2) * B  # this ensures the first B is 0
         zero_last = (1 - last) * B
@@ -81,7 +81,7 @@ class PPO:
                         * sample.adv
                     )
                     action_loss = -torch.min(surr1, surr2).mean()
-                    logger.update(action_loss=action_loss)
+                    logger.update(action_loss=action_loss.detach())
                     loss += action_loss
 
                 if self.use_clipped_value_loss:
@@ -96,7 +96,7 @@ class PPO:
                     )
                 else:
                     value_loss = 0.5 * F.mse_loss(sample.ret, values)
-                logger.update(value_loss=value_loss)
+                logger.update(value_loss=value_loss.detach())
                 loss += self.value_loss_coef * value_loss
 
                 self.optimizer.zero_grad()
@@ -109,4 +109,8 @@ class PPO:
                 logger.update(n=1.0)
 
         n = logger.pop("n", 0)
-        return {k: v.mean().item() / n for k, v in logger.items()}
+        if not logger:
+            return {}
+        # one device-to-host transfer instead of an .item() sync per metric
+        means = torch.stack([v.mean() for v in logger.values()]) / n
+        return dict(zip(logger.keys(), means.tolist()))
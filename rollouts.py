@@ -5,7 +5,6 @@ import gym
 from gym import spaces
 import numpy as np
 import torch
-from torch.utils.data.sampler import BatchSampler, SubsetRandomSampler
 from utils import space_shape
 
 
@@ -131,10 +130,10 @@ class RolloutStorage(object):
         )
         mini_batch_size = total_batch_size // num_batch
 
-        random_sampler = SubsetRandomSampler(range(total_batch_size))
-        sampler = BatchSampler(
-            sampler=random_sampler, batch_size=mini_batch_size, drop_last=False
-        )
+        # draw every minibatch's indices as one tensor on the buffers' device
+        # so make_batch does not convert a python list per buffer
+        perm = torch.randperm(total_batch_size, device=self.rewards.device)
+        sampler = perm.split(mini_batch_size)
         assert len(sampler) == num_batch
         for indices in sampler:
             assert len(indices) == mini_batch_size
@@ -177,42 +176,20 @@ class RolloutStorage(object):
         num_envs_per_batch = num_processes // num_mini_batch
         perm = torch.randperm(num_processes)
         for start_ind in range(0, num_processes, num_envs_per_batch):
-            obs_batch = []
-            recurrent_hidden_states_batch = []
-            actions_batch = []
-            value_preds_batch = []
-            return_batch = []
-            masks_batch = []
-            old_action_log_probs_batch = []
-            adv_targ = []
-
-            for offset in range(num_envs_per_batch):
-                ind = perm[start_ind + offset]
-                obs_batch.append(self.obs[:-1, ind])
-                recurrent_hidden_states_batch.append(
-                    self.recurrent_hidden_states[0:1, ind]
-                )
-                actions_batch.append(self.actions[:, ind])
-                value_preds_batch.append(self.value_preds[:-1, ind])
-                return_batch.append(self.returns[:-1, ind])
-                masks_batch.append(self.masks[:-1, ind])
-                old_action_log_probs_batch.append(self.action_log_probs[:, ind])
-                adv_targ.append(advantages[:, ind])
+            ind = perm[start_ind : start_ind + num_envs_per_batch]
 
             T, N = self.num_steps, num_envs_per_batch
-            # These are all tensors of size (T, N, -1)
-            obs_batch = torch.stack(obs_batch, 1)
-            actions_batch = torch.stack(actions_batch, 1)
-            value_preds_batch = torch.stack(value_preds_batch, 1)
-            return_batch = torch.stack(return_batch, 1)
-            masks_batch = torch.stack(masks_batch, 1)
-            old_action_log_probs_batch = torch.stack(old_action_log_probs_batch, 1)
-            adv_targ = torch.stack(adv_targ, 1)
+            # These are all tensors of size (T, N, -1), gathered in one indexing op
+            obs_batch = self.obs[:-1, ind]
+            actions_batch = self.actions[:, ind]
+            value_preds_batch = self.value_preds[:-1, ind]
+            return_batch = self.returns[:-1, ind]
+            masks_batch = self.masks[:-1, ind]
+            old_action_log_probs_batch = self.action_log_probs[:, ind]
+            adv_targ = advantages[:, ind]
 
             # States is just a (N, -1) tensor
-            recurrent_hidden_states_batch = torch.stack(
-                recurrent_hidden_states_batch, 1
-            ).view(N, -1)
+            recurrent_hidden_states_batch = self.recurrent_hidden_states[0, ind]
 
             # Flatten the (T, N, ...) tensors to (T * N, ...)
             obs_batch = _flatten_helper(T, N, obs_batch)
@@ -1,7 +1,9 @@
+import copy
 import inspect
 import itertools
 import os
 from collections import namedtuple, Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 from multiprocessing import Queue
 from pathlib import Path
 from pprint import pprint
@@ -36,6 +38,22 @@ EpochOutputs = namedtuple("EpochOutputs", "obs reward done infos act masks")
 CHECKPOINT_NAME = "checkpoint.pt"
 
 
+def to_cpu(x):
+    # copy every tensor in a (nested) state dict so a save thread can write it
+    # while training keeps updating the originals
+    if torch.is_tensor(x):
+        return x.detach().to("cpu", copy=True)
+    if isinstance(x, dict):
+        # shallow-copy first so Module.state_dict()'s _metadata survives
+        y = copy.copy(x)
+        for k, v in x.items():
+            y[k] = to_cpu(v)
+        return y
+    if isinstance(x, (list, tuple)):
+        return type(x)(map(to_cpu, x))
+    return x
+
+
 class Trainer:
     @classmethod
     def args_to_methods(cls):
@@ -271,6 +289,8 @@ class Trainer:
         time_spent = TotalTimeKeeper()
         time_per = AverageTimeKeeper()
         time_per["iter"].tick()
+        saver = ThreadPoolExecutor(max_workers=1)  # one write at a time to save_path
+        saving = None  # Future of the pending checkpoint write
 
         for i in itertools.count():
             frames.update(so_far=frames_per_update)
@@ -354,14 +374,22 @@ class Trainer:
                     train_infos = cls.build_infos_aggregator()
 
             if done or (save_interval and frames["since_save"] > save_interval):
+                # times the snapshot plus any wait on a write, i.e. how long
+                # saving blocks training
                 time_spent["saving"].tick()
                 frames["since_save"] = 0
-                cls.save_checkpoint(
+                if saving is not None:
+                    saving.result()  # re-raises a failed write here
+                saving = cls.save_checkpoint(
+                    saver,
                     save_path,
                     ppo=ppo,
                     agent=agent,
                     step=i,
                 )
+                if done:
+                    saving.result()
+                    saver.shutdown()
                 time_spent["saving"].update()
 
             if done:
@@ -412,13 +440,31 @@ class Trainer:
             time_per["update"].update()
 
     @staticmethod
-    def save_checkpoint(save_path: Path, ppo: PPO, agent: Agent, step: int):
+    def save_checkpoint(
+        saver: ThreadPoolExecutor, save_path: Path, ppo: PPO, agent: Agent, step: int
+    ) -> Future:
         modules = dict(
             optimizer=ppo.optimizer, agent=agent
         )  # type: Dict[str, torch.nn.Module]
-        state_dict = {name: module.state_dict() for name, module in modules.items()}
-        torch.save(dict(step=step, **state_dict), save_path)
-        print(f"Saved parameters to {save_path}")
+        state_dict = {
+            name: to_cpu(module.state_dict()) for name, module in modules.items()
+        }
+
+        def save():
+            # write beside save_path and swap it in, so an interrupted write
+            # never truncates the previous checkpoint
+            tmp_path = save_path.with_name(save_path.name + ".tmp")
+            try:
+                torch.save(dict(step=step, **state_dict), tmp_path)
+                os.replace(tmp_path, save_path)
+            except Exception:
+                tmp_path.unlink(missing_ok=True)
+                raise
+            print(f"Saved parameters to {save_path}")
+
+        # the executor's workers are joined at interpreter exit, so a pending
+        # write still completes if run() raises
+        return saver.submit(save)
 
     @classmethod
     def structure_config(cls, cfg: DictConfig) -> Dict[str, any]:
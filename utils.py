@@ -5,7 +5,7 @@ import random
 import re
 import subprocess
 from dataclasses import fields, is_dataclass
-from functools import reduce
+from functools import lru_cache, reduce
 from io import StringIO
 from typing import List, Optional
 
@@ -16,6 +16,8 @@ import torch.nn as nn
 from gym import spaces
 import gym
 
+TRAILING_NUMBER = re.compile(r"\d+$")
+
 
 def round(x, dec):
     return torch.round(x * 10 ** dec) / 10 ** dec
@@ -78,6 +80,7 @@ def get_index(array, idxs):
     return array[tuple(idxs.T)]
 
 
+@lru_cache
 def get_n_gpu():
     nvidia_smi = subprocess.check_output(
         "nvidia-smi --format=csv --query-gpu=memory.free".split(),
@@ -193,7 +196,7 @@ def hierarchical_parse_args(parser: argparse.ArgumentParser, include_positional=
 
 
 def get_device(name):
-    match = re.search("\d+$", name)
+    match = TRAILING_NUMBER.search(name)
     if match:
         device_num = int(match.group()) % get_n_gpu()
     else: